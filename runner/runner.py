@@ -13,7 +13,8 @@ from datetime import datetime
 from abc import ABC, abstractmethod
 from ase import db
 from ase import Atoms
-from runner.utils import Cd, run
+from runner.utils import Cd, run, write_file
+from runner.utils.utils import _single_connection
 from runner.utils.runnerdata import RunnerData
 
 logger = logging.getLogger(__name__)
@@ -26,6 +27,16 @@ stream_handler.setFormatter(formatter)
 
 logger.addHandler(stream_handler)
 
+# maximum number of characters of the run log stored in the row data
+max_log_length = 32 * 1024
+
+
+def _append_log(runner_data, log_msg):
+    """appends log_msg to the run log, keeping only the latest
+    max_log_length characters so that the row data stays bounded"""
+    log = runner_data.get("log", "") + log_msg
+    runner_data["log"] = log[-max_log_length:]
+
 
 class BaseRunner(ABC):
     """
@@ -38,7 +49,9 @@ class BaseRunner(ABC):
             Files, tasks, and scheduler_options can be added to be added
             to all the runs handled by this runner.
         max_jobs (int): maximum number of jobs running at an instance
-        cycle_time (int): time in seconds
+        cycle_time (int): time in seconds between spool cycles, the
+            running status is queried less often, up to every 10 cycles,
+            while no row changes
         keep_run (bool): keep the folder in which the run was performed
         run_folder (str): the folder that needs to be populated
         multi_fail (int): The number of re-runs on failure
@@ -75,6 +88,10 @@ class BaseRunner(ABC):
         self.run_folder = os.path.abspath(run_folder)
         self.multi_fail = multi_fail
         self.interpreter = interpreter
+        # timestamp of the present spool cycle, shared by its log messages
+        self._cycle_ts = None
+        # job ids read from job.id, with the modification time of the file
+        self._job_ids = {}
 
         if pre_runner_data is None:
             self.pre_runner_data = RunnerData()
@@ -116,6 +133,13 @@ class BaseRunner(ABC):
         meta["runners"].update({self.name: dict_})
         self.fdb.metadata = meta
 
+    def _now(self):
+        """timestamp for log messages, fixed for the duration of a spool
+        cycle"""
+        if self._cycle_ts is None:
+            return datetime.now()
+        return self._cycle_ts
+
     @classmethod
     def from_database(cls, name, database):
         """Get runner from database
@@ -173,14 +197,20 @@ class BaseRunner(ABC):
         Returns:
             int or None: job_id of input_id if running, else None
         """
+        job_file = os.path.join(self.run_folder, str(input_id), "job.id")
         try:
-            with Cd(self.run_folder, mkdir=False):
-                with Cd(str(input_id), mkdir=False):
-                    with open("job.id") as file_o:
-                        job_id = file_o.readline().strip()
-            return job_id
+            # the job id is read again only if job.id changed
+            mtime = os.stat(job_file).st_mtime_ns
+            cached = self._job_ids.get(str(input_id), None)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            with open(job_file) as file_o:
+                job_id = file_o.readline().strip()
         except FileNotFoundError:
+            self._job_ids.pop(str(input_id), None)
             return None
+        self._job_ids[str(input_id)] = (mtime, job_id)
+        return job_id
 
     @abstractmethod
     def _submit(self, tasks, scheduler_options):
@@ -225,18 +255,66 @@ class BaseRunner(ABC):
         """
         pass
 
-    def _update_status_running(self):
+    def _get_runner_ids(self):
         """
-        changes running to failed or done if finished
+        Returns ids of the rows handled by the runner, grouped by status.
+        Only one database scan is needed per spool cycle.
+
+        Returns:
+            dict: dictionary of status, ids list
         """
-        # get status of running jobs
-        update_ids_status = {}
+        status_ids = {"failed": [], "cancel": [], "running": [], "submit": []}
         for row in self.fdb.select(
-            status="running", runner=f"{self.name}", columns=["id"], include_data=False
+            runner=f"{self.name}",
+            columns=["id", "key_value_pairs"],
+            include_data=False,
         ):
-            id_ = row.id
+            status = row.get("status", None)
+            if status in status_ids:
+                status_ids[status].append(row.id)
+        return status_ids
+
+    def _refresh_status(self, job_ids):
+        """
+        Hook to query the status of all job_ids at once, before
+        :meth:`_status` is called for each of them in a spool cycle.
+        Does nothing by default.
+
+        Args:
+            job_ids (list): job ids of the running jobs
+
+        Returns:
+            set: job ids known to be still running, :meth:`_status` is
+            not called for them in this spool cycle
+        """
+        return set()
+
+    def _update_status_running(self, running_ids):
+        """
+        changes running to failed or done if finished
+
+        Args:
+            running_ids (list): ids with running status
+
+        Returns:
+            int: number of ids still running
+        """
+        # get job ids of running jobs
+        job_ids = {}
+        for id_ in running_ids:
             logger.debug("getting job id {}".format(id_))
-            job_id = self.get_job_id(id_)
+            job_ids[id_] = self.get_job_id(id_)
+        # query status of all the jobs at once, if supported
+        still_running = self._refresh_status(
+            [job_id for job_id in job_ids.values() if job_id]
+        )
+
+        # get status of running jobs
+        update_ids_status = {}
+        for id_, job_id in job_ids.items():
+            if job_id in still_running:
+                # unchanged since the last cycle, nothing to update
+                continue
             if job_id:
                 logger.debug("job_id success; getting status")
                 # !TODO: update scheduler options with cpu usage
@@ -249,7 +327,7 @@ class BaseRunner(ABC):
                 status, atoms, log_msg = [
                     "failed",
                     None,
-                    "{}\nJob id lost\n" "".format(datetime.now()),
+                    "{}\nJob id lost\n" "".format(self._now()),
                 ]
             if status != "running":
                 # if not still running, update status and add log message
@@ -274,7 +352,7 @@ class BaseRunner(ABC):
                         except Exception as e:
                             status = "failed"
                             log_msg += "{}\n Unpickling failed: {}\n" "".format(
-                                datetime.now(), e
+                                self._now(), e
                             )
             # run post-tasks
             if status == "done":
@@ -284,8 +362,7 @@ class BaseRunner(ABC):
                 data = self.fdb.get(id_).data
 
                 # updating status and log
-                _ = data["runner"].get("log", "") + log_msg
-                data["runner"]["log"] = _
+                _append_log(data["runner"], log_msg)
                 # remove old data
                 atoms.info.pop("data", None)
                 atoms.info.pop("unique_id", None)
@@ -297,9 +374,10 @@ class BaseRunner(ABC):
                 self.fdb.update(id_, atoms=atoms, data=data, **key_value_pairs)
                 # delete run if keep_run is False
                 if not self.keep_run and not data["runner"].get("keep_run", False):
-                    with Cd(self.run_folder):
-                        if str(id_) in os.listdir():
-                            shutil.rmtree(str(id_))
+                    try:
+                        shutil.rmtree(os.path.join(self.run_folder, str(id_)))
+                    except FileNotFoundError:
+                        pass
             else:
                 logger.debug("status:failed")
                 # getting data
@@ -313,13 +391,15 @@ class BaseRunner(ABC):
                         data["runner"]["fail_count"] += 1
 
                 # updating status and log
-                _ = data["runner"].get("log", "") + log_msg
-                data["runner"]["log"] = _
+                _append_log(data["runner"], log_msg)
                 logger.debug("updating")
                 self.fdb.update(id_, status=status, data=data)
 
             # print status
             logger.info("Id {} finished with status: {}".format(id_, status))
+            self._job_ids.pop(str(id_), None)
+
+        return len(running_ids) - len(update_ids_status)
 
     def get_status(self):
         """
@@ -346,18 +426,21 @@ class BaseRunner(ABC):
 
         return status_dict
 
-    def _submit_run(self):
+    def _submit_run(self, submit_ids, len_running):
         """
         submits runs
+
+        Args:
+            submit_ids (list): ids with submit status
+            len_running (int): number of ids presently running
         """
-        len_running = self.fdb.count(status="running", runner=f"{self.name}")
-        submit_ids = []
-        for row in self.fdb.select(
-            status="submit", runner=f"{self.name}", columns=["id"], include_data=False
-        ):
-            submit_ids.append(row.id)
         # submiting pending jobs
         sent_jobs = 0
+        # prepared runs to submit and rows to update
+        submissions = []
+        updates = []
+        # pre_runner_data is checked once per call, on first use
+        pre_data = None
         for id_ in submit_ids:
             row = self.fdb.get(id_)
             logger.debug("submit {}".format(id_))
@@ -385,7 +468,7 @@ class BaseRunner(ABC):
                 _ = row.data.get("runner", {})
                 _.update(
                     {
-                        "log": "{}\n{}\n" "".format(datetime.now(), err),
+                        "log": "{}\n{}\n" "".format(self._now(), err),
                         "fail_count": self.multi_fail + 1,
                     }
                 )
@@ -394,9 +477,11 @@ class BaseRunner(ABC):
                 continue
 
             # add local runner things
-            runner_data = self.pre_runner_data
-            _ = runner_data.get_runner_data(_skip_empty_task_test=True)
-            (pscheduler_options, _, _, ptasks, pfiles) = _
+            if pre_data is None:
+                pre_data = self.pre_runner_data.get_runner_data(
+                    _skip_empty_task_test=True
+                )
+            (pscheduler_options, _, _, ptasks, pfiles) = pre_data
             scheduler_options.update(pscheduler_options)
             files.update(pfiles)
             tasks = ptasks + tasks  # prior execution of local tasks
@@ -441,30 +526,40 @@ class BaseRunner(ABC):
 
             with Cd(self.run_folder):
                 with Cd(str(id_)):
-                    # submitting task
-                    logger.debug("submitting {}".format(id_))
-
                     # preparing run script
+                    logger.debug("preparing {}".format(id_))
                     (run_scripts, status, log_msg) = self._write_run_data(
                         atoms, tasks, files, status, log_msg
                     )
-                    if status == "submit":
-                        job_id, log_msg = self._submit(run_scripts, scheduler_options)
-                        if job_id:
-                            logger.debug("submitting success {}" "".format(job_id))
-                            # update status and save job_id
-                            status = "running"
-                            with open("job.id", "w") as file_o:
-                                file_o.write("{}".format(job_id))
-                            sent_jobs += 1
-                        else:
-                            logger.debug("submitting failed {}" "".format(job_id))
-                            status = "failed"
+            if status == "submit":
+                # submitted together with the other prepared runs
+                submissions.append((id_, run_scripts, scheduler_options))
+                sent_jobs += 1
+            updates.append([id_, row, name, status, log_msg])
+
+        # submitting tasks
+        logger.debug("submitting {} runs".format(len(submissions)))
+        results = dict(zip([x[0] for x in submissions], self._submit_many(submissions)))
+        for update in updates:
+            id_ = update[0]
+            if id_ in results:
+                job_id, update[4] = results[id_]
+                if job_id:
+                    logger.debug("submitting success {}" "".format(job_id))
+                    # update status and save job_id
+                    update[3] = "running"
+                    job_file = os.path.join(self.run_folder, str(id_), "job.id")
+                    with open(job_file, "w") as file_o:
+                        file_o.write("{}".format(job_id))
+                    self._job_ids.pop(str(id_), None)
+                else:
+                    logger.debug("submitting failed {}" "".format(job_id))
+                    update[3] = "failed"
 
-            # updating database
+        # updating database
+        for id_, row, name, status, log_msg in updates:
             data = row.data
-            _ = data["runner"].get("log", "") + log_msg
-            data["runner"]["log"] = _
+            _append_log(data["runner"], log_msg)
             logger.debug("updating database")
             # adds status, name of calculation, and data
             self.fdb.update(id_, status=status, run_name=name, data=data)
@@ -473,6 +568,24 @@ class BaseRunner(ABC):
                 "{}".format(id_, (status if status == "failed" else "successful"))
             )
 
+    def _submit_many(self, submissions):
+        """
+        Submits prepared runs, by default one by one using :meth:`_submit`
+        in the run folder of each row
+
+        Args:
+            submissions (list): list of (id, tasks, scheduler_options)
+
+        Returns:
+            list: list of (job id, log message) in the order of submissions
+        """
+        results = []
+        for id_, tasks, scheduler_options in submissions:
+            with Cd(self.run_folder, mkdir=False):
+                with Cd(str(id_), mkdir=False):
+                    results.append(self._submit(tasks, scheduler_options))
+        return results
+
     def _write_run_data(self, atoms, tasks, files, status, log_msg):
         """
         writes run data in the folder for excecution
@@ -515,14 +628,21 @@ class BaseRunner(ABC):
                 else:
                     params = {}
 
-                # write params
+                # write params, run.py runs without params if there is no file
+                params_file = "params{}.json".format(py_run)
                 try:
-                    with open("params{}.json".format(py_run), "w") as file_o:
-                        json.dump(params, file_o)
+                    if isinstance(params, dict) and len(params) == 0:
+                        # remove params of an earlier run in a reused folder
+                        try:
+                            os.remove(params_file)
+                        except FileNotFoundError:
+                            pass
+                    else:
+                        write_file(params_file, json.dumps(params))
                 except TypeError as err:
                     status = "failed"
                     log_msg = "{}\n Error writing params: {}\n".format(
-                        datetime.now(), err.args[0]
+                        self._now(), err.args[0]
                     )
                     break
                 # making python executable
@@ -536,43 +656,56 @@ class BaseRunner(ABC):
 
         return run_scripts, status, log_msg
 
-    def _cancel_run(self):
+    def _cancel_run(self, cancel_ids):
         """
         Cancels run in cancel
+
+        Args:
+            cancel_ids (list): ids with cancel status
         """
-        cancel_ids = []
-        for row in self.fdb.select(
-            status="cancel", runner=f"{self.name}", columns=["id"], include_data=False
-        ):
-            cancel_ids.append(row.id)
+        job_ids = {}
         for id_ in cancel_ids:
-            row = self.fdb.get(id_)
             logger.debug("cancel {}".format(id_))
-            job_id = self.get_job_id(id_)
-            if job_id:
-                logger.debug("found {}".format(id_))
-                # cancel the job and update database
-                self._cancel(job_id)
-                status, log_msg = [
-                    "failed",
-                    "{}\nCancelled by user\n" "".format(datetime.now()),
-                ]
-            else:
-                logger.debug("lost {}".format(id_))
-                # no job_id but still cancel, eg when pending
-                status, log_msg = [
-                    "failed",
-                    "{}\nCancelled by user, "
-                    "no job was running\n"
-                    "".format(datetime.now()),
-                ]
-            # updating status and log
-            data = row.data
-            _ = data["runner"].get("log", "") + log_msg
-            data["runner"]["log"] = _
-            logger.debug("update {}".format(id_))
-            self.fdb.update(id_, status=status, data=data)
-            logger.info("Cancelled {}".format(id_))
+            job_ids[id_] = self.get_job_id(id_)
+        # cancel all the found jobs at once
+        self._cancel_many([job_id for job_id in job_ids.values() if job_id])
+
+        # update all the cancelled rows in one transaction
+        with _single_connection(self.fdb):
+            for id_, job_id in job_ids.items():
+                row = self.fdb.get(id_)
+                if job_id:
+                    logger.debug("found {}".format(id_))
+                    status, log_msg = [
+                        "failed",
+                        "{}\nCancelled by user\n" "".format(self._now()),
+                    ]
+                else:
+                    logger.debug("lost {}".format(id_))
+                    # no job_id but still cancel, eg when pending
+                    status, log_msg = [
+                        "failed",
+                        "{}\nCancelled by user, "
+                        "no job was running\n"
+                        "".format(self._now()),
+                    ]
+                # updating status and log
+                data = row.data
+                _append_log(data["runner"], log_msg)
+                logger.debug("update {}".format(id_))
+                self.fdb.update(id_, status=status, data=data)
+                logger.info("Cancelled {}".format(id_))
+                self._job_ids.pop(str(id_), None)
+
+    def _cancel_many(self, job_ids):
+        """
+        Cancels job_ids, by default one by one using :meth:`_cancel`
+
+        Args:
+            job_ids (list): job ids to cancel
+        """
+        for job_id in job_ids:
+            self._cancel(job_id)
 
     def spool(self, _endless=True):
         """
@@ -584,6 +717,12 @@ class BaseRunner(ABC):
         self.to_database(update=True)
         # now set the runner as running
         self._set_running()
+        # rows of the runner by status in the last cycle
+        last_status_ids = None
+        # cycles between running status queries, doubled while the query
+        # reports no finished jobs, and cycles left until the next query
+        status_interval = 1
+        status_wait = 0
         try:
             while True:
                 # check for metadata stop
@@ -599,40 +738,55 @@ class BaseRunner(ABC):
                     break
 
                 # starting operation
+                self._cycle_ts = datetime.now()
+                status_ids = self._get_runner_ids()
+                if status_ids != last_status_ids:
+                    # rows changed, query the running status again right away
+                    status_interval = 1
+                    status_wait = 0
+                last_status_ids = {key: list(ids) for key, ids in status_ids.items()}
+
                 logger.info("Searching failed jobs")
-                failed_ids = []
-                for row in self.fdb.select(
-                    status="failed",
-                    runner=f"{self.name}",
-                    columns=["id"],
-                    include_data=False,
-                ):
-                    failed_ids.append(row.id)
-                for id_ in failed_ids:
-                    row = self.fdb.get(id_)
-                    update = False
-                    if "runner" not in row.data:
-                        row.data["runner"] = {}
-                    if "fail_count" not in row.data["runner"]:
-                        row.data["runner"]["fail_count"] = self.multi_fail + 1
-                    if row.data["runner"]["fail_count"] <= self.multi_fail:
-                        # submit in next cycle
-                        logger.debug("re-submitted: {}".format(id_))
-                        update = True
-                    if update:
-                        self.fdb.update(id_, status="submit", data=row.data)
+                # re-submit failed rows in one transaction
+                with _single_connection(self.fdb):
+                    for id_ in status_ids["failed"]:
+                        row = self.fdb.get(id_)
+                        update = False
+                        if "runner" not in row.data:
+                            row.data["runner"] = {}
+                        if "fail_count" not in row.data["runner"]:
+                            row.data["runner"]["fail_count"] = self.multi_fail + 1
+                        if row.data["runner"]["fail_count"] <= self.multi_fail:
+                            # submit in next cycle
+                            logger.debug("re-submitted: {}".format(id_))
+                            update = True
+                        if update:
+                            self.fdb.update(id_, status="submit", data=row.data)
+                            status_ids["submit"].append(id_)
 
                 # cancel jobs
                 logger.info("Cancelling jobs, if jobs to cancel")
-                self._cancel_run()
+                self._cancel_run(status_ids["cancel"])
 
                 # update if running have finished
-                logger.info("Updating running status")
-                self._update_status_running()
+                len_running = len(status_ids["running"])
+                if status_wait > 0:
+                    logger.debug("Skipping running status, no changes")
+                    status_wait -= 1
+                else:
+                    logger.info("Updating running status")
+                    still_running = self._update_status_running(status_ids["running"])
+                    if still_running == len_running:
+                        # no job finished, back off the next query
+                        status_interval = min(2 * status_interval, 10)
+                    else:
+                        status_interval = 1
+                    status_wait = status_interval - 1
+                    len_running = still_running
 
                 # send submit for run
                 logger.info("Submitting")
-                self._submit_run()
+                self._submit_run(sorted(status_ids["submit"]), len_running)
 
                 if _endless:
                     # sleep before checking again
@@ -644,4 +798,5 @@ class BaseRunner(ABC):
         except KeyboardInterrupt:
             pass
         finally:
+            self._cycle_ts = None
             self._unset_running()
@@ -1,6 +1,7 @@
+import os
 from runner.runner import BaseRunner
+from runner.utils import Cd, write_file
 import subprocess as sb
-from _datetime import datetime
 
 
 # List of states from the man page of squeue
@@ -42,6 +43,21 @@ _slurm_map = {
     "TIMEOUT": ["failed", "Job terminated upon reaching its time limit."],
 }
 
+# status bit flags, the states of a job and its steps are combined with |
+_running, _done, _failed = 1, 2, 4
+_status_flags = {"running": _running, "done": _done, "failed": _failed}
+# _slurm_map keyed by the raw sacct state, mapped to status flag and message
+_slurm_bmap = {
+    key.encode(): (_status_flags[value[0]], value[1])
+    for key, value in _slurm_map.items()
+}
+
+# SBATCH options setting the output files of a job
+_output_options = {"-o", "--output", "-e", "--error"}
+# maximum number of tasks in one job array, below the default MaxArraySize
+# of slurm (1001), larger groups are split in several arrays
+max_array_size = 1000
+
 
 class SlurmRunner(BaseRunner):
     """
@@ -57,7 +73,9 @@ class SlurmRunner(BaseRunner):
             Files, tasks, and scheduler_options can be added to all the runs
             handled by this runner.
         max_jobs (int): maximum number of jobs running at an instance
-        cycle_time (int): time in seconds
+        cycle_time (int): time in seconds between spool cycles, the
+            running status is queried less often, up to every 10 cycles,
+            while no row changes
         keep_run (bool): keep the folder in which the run was performed
         run_folder (str): the folder that needs to be populated
         multi_fail (int): The number of re-runs on failure
@@ -91,6 +109,37 @@ class SlurmRunner(BaseRunner):
             multi_fail=multi_fail,
             logfile=logfile,
         )
+        # status of the jobs queried in the present spool cycle
+        self._status_cache = {}
+        # squeue arguments, set on the first squeue query
+        self._squeue_args = None
+
+    def _batch_script(self, tasks, scheduler_options):
+        """
+        Returns batch script of tasks with scheduler_options as SBATCH options
+
+        Args:
+            tasks (list): list of tasks to be added
+            scheduler_options (dictionary): dictionary of headers to be added
+
+        Returns:
+            str: batch script
+        """
+        # add interpreter
+        run_script = ["{}\n".format(self.interpreter)]
+
+        # add SBATCH options
+        run_script += [
+            "#SBATCH {}{}{}\n".format(key, "=" if key.startswith("--") else " ", value)
+            for key, value in scheduler_options.items()
+        ]
+
+        # make script escape if error
+        run_script.append("\nset -e\n")
+
+        # add tasks
+        run_script.append("\n".join(tasks))
+        return "".join(run_script)
 
     def _submit(self, tasks, scheduler_options):
         """
@@ -108,27 +157,9 @@ class SlurmRunner(BaseRunner):
         job_id = None
 
         log_msg = "{}\nSubmission using {} scheduler\n" "".format(
-            datetime.now(), self.name
+            self._now(), self.name
         )
-        # add interpreter
-        run_script = "{}\n".format(self.interpreter)
-
-        # add SBATCH options
-        for key, value in scheduler_options.items():
-            run_script += "#SBATCH {}{}{}\n" "".format(
-                key, "=" if key.startswith("--") else " ", value
-            )
-
-        run_script += "\n"
-
-        # make script escape if error
-        run_script += "set -e\n"
-
-        # add tasks
-        run_script += "\n".join(tasks)
-
-        with open("batch.slrm", "w") as fio:
-            fio.write(run_script)
+        write_file("batch.slrm", self._batch_script(tasks, scheduler_options))
 
         out = sb.run(["sbatch", "batch.slrm"], stderr=sb.PIPE, stdout=sb.PIPE)
         if out.returncode == 0:
@@ -140,6 +171,93 @@ class SlurmRunner(BaseRunner):
             log_msg += "Submission failed: {}" "\n".format(out.stderr.decode("utf-8"))
         return job_id, log_msg
 
+    def _submit_many(self, submissions):
+        """
+        Submits prepared runs. Runs with the same scheduler_options are
+        submitted together as slurm job arrays of at most
+        :data:`max_array_size` tasks, the rest are submitted one by one.
+
+        Args:
+            submissions (list): list of (id, tasks, scheduler_options)
+
+        Returns:
+            list: list of (job id, log message) in the order of submissions
+        """
+        groups = {}
+        for i, (_, _, scheduler_options) in enumerate(submissions):
+            if _output_options.isdisjoint(scheduler_options):
+                key = repr(sorted(scheduler_options.items()))
+            else:
+                # custom output files cannot be shared in a job array
+                key = i
+            groups.setdefault(key, []).append(i)
+
+        results = [None] * len(submissions)
+        for group_indices in groups.values():
+            for start in range(0, len(group_indices), max_array_size):
+                indices = group_indices[start : start + max_array_size]
+                group = [submissions[i] for i in indices]
+                if len(group) == 1:
+                    group_results = super()._submit_many(group)
+                else:
+                    group_results = self._submit_array(group)
+                for i, result in zip(indices, group_results):
+                    results[i] = result
+        return results
+
+    def _submit_array(self, submissions):
+        """
+        Submits runs with the same scheduler_options as one slurm job array.
+        Each array task runs batch.slrm in the run folder of its row.
+
+        Args:
+            submissions (list): list of (id, tasks, scheduler_options)
+
+        Returns:
+            list: list of (job id, log message) in the order of submissions
+        """
+        log_msg = "{}\nSubmission using {} scheduler\n" "".format(
+            self._now(), self.name
+        )
+        ids = []
+        for id_, tasks, scheduler_options in submissions:
+            ids.append(str(id_))
+            with Cd(os.path.join(self.run_folder, ids[-1]), mkdir=False):
+                write_file("batch.slrm", self._batch_script(tasks, scheduler_options))
+                os.chmod("batch.slrm", 0o755)
+
+        # output of each task is written in its run folder
+        scheduler_options = dict(submissions[0][2])
+        scheduler_options.update({"--output": "/dev/null", "--error": "/dev/null"})
+        # row id of the array task, in POSIX shell for any interpreter
+        tasks = [
+            "set -- {}".format(" ".join(ids)),
+            'shift "$SLURM_ARRAY_TASK_ID"',
+            'cd "{}/$1"'.format(self.run_folder),
+            "./batch.slrm > slurm-${SLURM_ARRAY_JOB_ID}_${SLURM_ARRAY_TASK_ID}.out 2>&1",
+        ]
+        # array script is kept in the run folder of the first row
+        with Cd(os.path.join(self.run_folder, ids[0]), mkdir=False):
+            write_file("array.slrm", self._batch_script(tasks, scheduler_options))
+            out = sb.run(
+                ["sbatch", "--array=0-{}".format(len(ids) - 1), "array.slrm"],
+                stderr=sb.PIPE,
+                stdout=sb.PIPE,
+            )
+        if out.returncode != 0:
+            # failed
+            log_msg += "Submission failed: {}" "\n".format(out.stderr.decode("utf-8"))
+            return [(None, log_msg) for _ in ids]
+        # successful submission
+        array_id = out.stdout.decode("utf-8").split()[-1]
+        return [
+            (
+                "{}_{}".format(array_id, i),
+                log_msg + "Submitted batch job {}_{}\n".format(array_id, i),
+            )
+            for i in range(len(ids))
+        ]
+
     def _cancel(self, job_id):
         """
         Cancels job_id
@@ -147,24 +265,152 @@ class SlurmRunner(BaseRunner):
         if job_id is not None:
             sb.run(["scancel", job_id])
 
-    def _status(self, job_id):
+    def _cancel_many(self, job_ids):
         """
-        return status of job_id
+        Cancels all job_ids with a single scancel call
 
         Args:
-            job_id (str): job id of the run
+            job_ids (list): job ids to cancel
+        """
+        if len(job_ids) > 0:
+            sb.run(["scancel", *job_ids])
+
+    def _refresh_status(self, job_ids):
+        """
+        Queries the status of all job_ids with a single sacct call and
+        caches it for the present spool cycle
+
+        Args:
+            job_ids (list): job ids of the running jobs
 
         Returns:
-            str: status of the job id
-            str: log message of the last change
+            set: job ids still running
         """
-        status = "running"
-        log_msg = ""
+        self._status_cache = self._query_status(job_ids)
+        return {
+            job_id
+            for job_id, (status, _) in self._status_cache.items()
+            if status == "running"
+        }
+
+    def _query_status(self, job_ids):
+        """
+        returns status of job_ids. The jobs still in the slurm queue are
+        checked with squeue, and only the jobs that left the queue are
+        checked with sacct, which queries the slower accounting database.
+
+        A job neither in the queue nor in sacct has lost its record and is
+        failed. If squeue or sacct could not be queried, or the job is still
+        in the queue, a job missing in sacct is kept running and checked
+        again in the next cycle.
+
+        Args:
+            job_ids (list): job ids of the runs
+
+        Returns:
+            dict: job id as key and a list of status and log message as value
+        """
+        if len(job_ids) == 0:
+            return {}
+        queue_states = self._squeue_states(job_ids)
+        status_dict = {}
+        sacct_ids = []
+        for job_id in job_ids:
+            state = None if queue_states is None else queue_states.get(job_id, None)
+            if state in _slurm_map and _slurm_map[state][0] == "running":
+                status_dict[job_id] = ["running", ""]
+            else:
+                # finished or unknown state, needs accounting information
+                sacct_ids.append(job_id)
+        sacct_status = self._sacct_status(sacct_ids)
+        for job_id in sacct_ids:
+            if sacct_status is not None and job_id in sacct_status:
+                status_dict[job_id] = sacct_status[job_id]
+            elif (
+                sacct_status is not None
+                and queue_states is not None
+                and job_id not in queue_states
+            ):
+                status_dict[job_id] = [
+                    "failed",
+                    "{}\n Job not found in squeue or sacct\n".format(self._now()),
+                ]
+            else:
+                # eg. not yet in the accounting database
+                status_dict[job_id] = ["running", ""]
+        return status_dict
+
+    def _squeue_states(self, job_ids):
+        """
+        returns slurm state of job_ids present in the slurm queue
+
+        Args:
+            job_ids (list): job ids of the runs
+
+        Returns:
+            dict or None: job id as key and slurm state as value, jobs not
+            in the queue are left out. None if squeue failed
+        """
+        if self._squeue_args is None:
+            self._squeue_args = ["squeue", "--noheader", "--array"]
+            try:
+                out = sb.run(["squeue", "--help"], stdout=sb.PIPE, stderr=sb.PIPE)
+            except OSError:
+                out = None
+            if out is not None and b"--only-job-state" in out.stdout:
+                # only request the job state from the controller
+                self._squeue_args.append("--only-job-state")
+        try:
+            out = sb.run(
+                self._squeue_args + ["--format", "%i %T", "--jobs", ",".join(job_ids)],
+                stdout=sb.PIPE,
+                stderr=sb.PIPE,
+            )
+        except OSError:
+            return None
+        if out.returncode != 0:
+            if b"Invalid job id" not in out.stderr:
+                return None
+            if len(job_ids) == 1:
+                # job already purged from the controller
+                return {}
+            # a single unknown job id fails the whole query, query the
+            # halves separately to find the jobs still in the queue
+            queue_states = {}
+            half = len(job_ids) // 2
+            for part in (job_ids[:half], job_ids[half:]):
+                part_states = self._squeue_states(part)
+                if part_states is None:
+                    return None
+                queue_states.update(part_states)
+            return queue_states
+        queue_states = {}
+        for line in out.stdout.decode("utf-8").split("\n"):
+            x = line.split()
+            if len(x) == 2:
+                queue_states[x[0]] = x[1]
+        return queue_states
+
+    def _sacct_status(self, job_ids):
+        """
+        returns status of job_ids using one sacct call
+
+        Args:
+            job_ids (list): job ids of the runs
+
+        Returns:
+            dict or None: job id as key and a list of status and log message
+            as value, jobs missing in sacct are left out. None if sacct failed
+        """
+        if len(job_ids) == 0:
+            return {}
         out = sb.run(
             [
                 "sacct",
                 "-j",
-                job_id,
+                ",".join(job_ids),
+                "--format",
+                "JobID",
                 "--format",
                 "JobName",
                 "--format",
@@ -176,46 +422,93 @@ class SlurmRunner(BaseRunner):
                 "--format",
                 "CPUTime",
                 "--parsable",
+                "--noheader",
             ],
             stdout=sb.PIPE,
             stderr=sb.PIPE,
         )
-        # get formatted output
-        formatted_out = [x.split("|") for x in out.stdout.decode("utf-8").split("\n")]
-        end_time = formatted_out[1][2].replace("T", " ")
-        cpu_time = formatted_out[1][4]
-
-        # slurm state of the job
-        # state_list = [x[1].split()[0] for x in formatted_out[1:-1]]
-        # better handling of the gibberish last line
-        state_list = []
-        for x in formatted_out[1:]:
-            try:
-                state_list.append(x[1].split()[0])
-            except IndexError:
-                # the last line in formatted_out is gibberish sometimes
+        if out.returncode != 0:
+            # eg. accounting database not reachable
+            return None
+        # group the lines of the output by job id, job steps such as
+        # <job id>.batch and <job id>.extern belong to <job id>
+        # the output is parsed as bytes, only the used fields are decoded
+        job_lines = {}
+        for line in out.stdout.splitlines():
+            x = line.split(b"|", 6)
+            if len(x) < 6:
+                # the last line is gibberish sometimes
                 # ignore if it is not as per the | format
-                pass
-        # scheduler status of the job
-        status_list = []
-        for state in state_list:
-            try:
-                status_list.append(_slurm_map[state][0])
-            except KeyError:
-                status = "failed"
-                log_msg += "{}\n Undefined slurm state:{}\n" "".format(end_time, state)
-                return status, log_msg
-
-        if "failed" in status_list:
-            state = state_list[status_list.index("failed")]
+                continue
+            job_lines.setdefault(x[0].split(b".")[0].decode("utf-8"), []).append(x)
+
+        return {
+            job_id: _parse_sacct(job_lines[job_id])
+            for job_id in job_ids
+            if job_id in job_lines
+        }
+
+    def _status(self, job_id):
+        """
+        return status of job_id
+
+        Args:
+            job_id (str): job id of the run
+
+        Returns:
+            str: status of the job id
+            str: log message of the last change
+        """
+        if job_id not in self._status_cache:
+            self._status_cache.update(self._query_status([job_id]))
+        return self._status_cache.pop(job_id)
+
+
+def _parse_sacct(lines):
+    """
+    returns status of a job from its sacct lines
+
+    Args:
+        lines (list): sacct lines (bytes) of the job split at |, the first
+            line being the job allocation followed by the job steps
+
+    Returns:
+        str: status of the job id
+        str: log message of the last change
+    """
+    status = "running"
+    log_msg = ""
+    end_time = lines[0][3].decode("utf-8").replace("T", " ")
+    cpu_time = lines[0][5].decode("utf-8")
+
+    # slurm state of the job, eg. 'CANCELLED by <uid>' is CANCELLED
+    flags = 0
+    failed_state = None
+    for x in lines:
+        state = x[2].split(None, 1)
+        if not state:
+            continue
+        flag = _slurm_bmap.get(state[0], None)
+        if flag is None:
             status = "failed"
-            log_msg += "{}\n{} {}\n".format(end_time, state, _slurm_map[state][1])
-        elif "running" in status_list:
-            status = "running"
-            log_msg += ""
-        else:
-            # done
-            status = "done"
-            log_msg += "{}\n Job finished.\nWall time={}".format(end_time, cpu_time)
+            log_msg += "{}\n Undefined slurm state:{}\n" "".format(
+                end_time, state[0].decode("utf-8")
+            )
+            return status, log_msg
+        if flag[0] == _failed and failed_state is None:
+            failed_state = state[0]
+        flags |= flag[0]
+
+    if flags & _failed:
+        status = "failed"
+        log_msg += "{}\n{} {}\n".format(
+            end_time, failed_state.decode("utf-8"), _slurm_bmap[failed_state][1]
+        )
+    elif flags & _running:
+        status = "running"
+    else:
+        # done
+        status = "done"
+        log_msg += "{}\n Job finished.\nWall time={}".format(end_time, cpu_time)
 
-        return status, log_msg
+    return status, log_msg
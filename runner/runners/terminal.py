@@ -1,6 +1,43 @@
+import os
 from runner.runner import BaseRunner
+from runner.utils import write_file
 import subprocess as sb
-from _datetime import datetime
+import psutil as ps
+
+
+_out_flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+
+
+def _spawn(script, outfile):
+    """Start script in the background with its output redirected to outfile
+
+    Uses posix_spawn where available, avoiding the fork of the (possibly
+    large) runner process. The child is reaped by :func:`_reap`.
+
+    Returns:
+        int: process id of the started script
+    """
+    if hasattr(os, "posix_spawn"):
+        file_actions = [
+            (os.POSIX_SPAWN_OPEN, 1, outfile, _out_flags, 0o644),
+            (os.POSIX_SPAWN_DUP2, 1, 2),
+        ]
+        return os.posix_spawn(script, [script], os.environ, file_actions=file_actions)
+    out_fd = os.open(outfile, _out_flags, 0o644)
+    try:
+        process = sb.Popen([script], stdout=out_fd, stderr=sb.STDOUT, close_fds=True)
+    finally:
+        os.close(out_fd)
+    return process.pid
+
+
+def _reap(pid, block=False):
+    """Collect the exit status of a finished child, if it is our child"""
+    try:
+        os.waitpid(pid, 0 if block else os.WNOHANG)
+    except ChildProcessError:
+        # not a child of this process, or already reaped
+        pass
 
 
 class TerminalRunner(BaseRunner):
@@ -17,7 +54,9 @@ class TerminalRunner(BaseRunner):
             Files, tasks, and scheduler_options can be added to be added
             to all the runs handled by this runner.
         max_jobs (int): maximum number of jobs running at an instance
-        cycle_time (int): time in seconds
+        cycle_time (int): time in seconds between spool cycles, the
+            running status is queried less often, up to every 10 cycles,
+            while no row changes
         keep_run (bool): keep the folder in which the run was performed
         run_folder (str): the folder that needs to be populated
         multi_fail (int): The number of re-runs on failure
@@ -51,6 +90,8 @@ class TerminalRunner(BaseRunner):
             multi_fail=multi_fail,
             logfile=logfile,
         )
+        # psutil processes of the jobs, by process id
+        self._processes = {}
 
     def _submit(self, tasks, scheduler_options):
         """
@@ -68,50 +109,46 @@ class TerminalRunner(BaseRunner):
         job_id = None
 
         log_msg = "{}\nSubmission using {} scheduler\n" "".format(
-            datetime.now(), self.name
+            self._now(), self.name
         )
         # add start status file
-        with open("status.txt", "w") as f:
-            f.write("start\n")
-
-        # add interpreter
-        run_script = "{}\n".format(self.interpreter)
-
-        # make script escape if error
-        run_script += "set -e\n"
+        write_file("status.txt", "start\n")
+
+        run_script = [
+            # add interpreter
+            "{}\n".format(self.interpreter),
+            # make script escape if error
+            "set -e\n",
+            # add tasks
+            "\n".join(tasks),
+            # add done status file on completion
+            "\necho done > status.txt\n",
+        ]
+        write_file("run.sh", "".join(run_script))
 
-        # add tasks
-        run_script += "\n".join(tasks)
-
-        # add done status file on completion
-        run_script += "\necho done > status.txt\n"
-
-        with open("run.sh", "w") as f:
-            f.write(run_script)
-
-        out = sb.run(["chmod", "+x", "run.sh"], stderr=sb.PIPE, stdout=sb.PIPE)
-        if out.returncode == 0:
-            out1 = sb.Popen(["./run.sh", ">", "run.out"])
+        try:
+            os.chmod("run.sh", 0o755)
+            job_id = _spawn("./run.sh", "run.out")
             # successful submission
-            job_id = out1.pid
             log_msg += "Submitted batch job {}\n".format(job_id)
-        else:
+        except OSError as err:
             # failed
-            log_msg += "Submission failed: {}" "\n".format(out.stderr.decode("utf-8"))
+            log_msg += "Submission failed: {}" "\n".format(err)
         return job_id, log_msg
 
     def _cancel(self, job_id):
         """
         Cancels job_id
         """
-        import psutil as ps
-
         if job_id is not None:
             try:
-                process = ps.Process(int(job_id))
+                process = self._processes.pop(int(job_id), None)
+                if process is None:
+                    process = ps.Process(int(job_id))
                 process.kill()
             except ps.NoSuchProcess:
                 pass
+            _reap(int(job_id), block=True)
 
     def _status(self, job_id):
         """
@@ -126,28 +163,30 @@ class TerminalRunner(BaseRunner):
         """
         status = "running"
         log_msg = ""
-        import psutil as ps
-
+        pid = int(job_id)
         try:
-            process = ps.Process(int(job_id))
-            if process.is_running():
-                # if its a zombie, process is still running
-                cmdline = process.cmdline()
-                if len(cmdline) == 0:
-                    status = "done"
-            else:
+            # reuse the process handle of the previous cycles
+            process = self._processes.get(pid, None)
+            if process is None:
+                process = self._processes[pid] = ps.Process(pid)
+            if process.status() in (ps.STATUS_ZOMBIE, ps.STATUS_DEAD):
+                # finished, but not yet reaped
                 status = "done"
         except ps.NoSuchProcess:
             status = "done"
+        if status == "done":
+            self._processes.pop(pid, None)
+            _reap(pid)
 
-        with open("status.txt", "r") as f:
-            lines = f.readlines()[0].strip()
-            if lines != "done" and status == "done":
-                status = "failed"
+        if status == "done":
+            # status file is only relevant once the process has finished
+            with open("status.txt", "r") as f:
+                if f.readline().strip() != "done":
+                    status = "failed"
 
         if status == "done":
-            log_msg += "{}\n Job finished.".format(datetime.now())
+            log_msg += "{}\n Job finished.".format(self._now())
         elif status == "failed":
-            log_msg += "{}\n Job failed".format(datetime.now())
+            log_msg += "{}\n Job failed".format(self._now())
 
         return status, log_msg
@@ -1,7 +1,10 @@
 """__init__ for utils"""
 from runner.utils.utils import (
     Cd,
+    write_file,
     json_keys2int,
+    json_dumps,
+    json_loads,
     get_status,
     submit,
     cancel,
@@ -14,7 +17,10 @@ from runner.utils.utils import (
 
 __all__ = [
     "Cd",
+    "write_file",
     "json_keys2int",
+    "json_dumps",
+    "json_loads",
     "get_status",
     "submit",
     "cancel",
@@ -1,25 +1,38 @@
 """
 python file to run python tasks
+
+usage: run.py func indx
+
+runs main of the func module with the params in params<indx>.json, if present
 """
 
+import sys
 import json
 import pickle
-import argparse
+from importlib import import_module
 
 
 def main():
-    # parse args
-    parser = argparse.ArgumentParser(description="Run function with params.")
-    parser.add_argument("func", type=str)
-    parser.add_argument("indx", type=int)
-    args = parser.parse_args()
+    # parse args, function module and params index
+    args = sys.argv[1:]
+    if args[:1] in (["-h"], ["--help"]):
+        print(__doc__)
+        sys.exit(0)
+    if len(args) != 2 or not args[1].isdigit():
+        sys.exit(__doc__)
+    func_name, indx = args[0], int(args[1])
 
     # import module
-    func = __import__(args.func)
+    func = import_module(func_name)
+
+    # open params, not written for tasks without params
+    try:
+        with open(f"params{indx}.json", "rb") as fio:
+            params = json.loads(fio.read())
+    except FileNotFoundError:
+        params = {}
 
-    # open params and atoms
-    with open(f"params{args.indx}.json") as fio:
-        params = json.load(fio)
+    # open atoms
     with open("atoms.pkl", "rb") as fio:
         atoms = pickle.load(fio)
 
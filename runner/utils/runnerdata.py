@@ -1,13 +1,28 @@
 """ Utility to handle runner data"""
-import json
 import os
+import pickle
 from base64 import b64encode
-from copy import copy
 
-from runner.utils.utils import json_keys2int, get_db_connect
+from runner.utils.utils import (
+    json_dumps,
+    json_loads,
+    get_db_connect,
+    write_file,
+    _single_connection,
+)
 
 
-default_files = ["run.sh", "batch.slrm", "atoms.pkl", "run.py", "status.txt", "job.id"]
+default_files = frozenset(
+    {"run.sh", "batch.slrm", "atoms.pkl", "run.py", "status.txt", "job.id"}
+)
+
+# accepted types, built once instead of on every check
+_sequence_types = (list, tuple)
+_content_types = (str, bytes)
+# extensions of files that are never text, not worth a decode attempt
+_binary_extensions = frozenset(
+    {".pkl", ".npy", ".npz", ".h5", ".tar", ".gz", ".png", ".jpg", ".pdf"}
+)
 
 
 class RunnerData:
@@ -65,6 +80,8 @@ class RunnerData:
         data: dictionary of the runner data
     """
 
+    __slots__ = ("data",)
+
     def __init__(self, name="untitled_run"):
         self.data = {
             "scheduler_options": {},
@@ -157,18 +174,7 @@ class RunnerData:
             add_as (str): name the file should be added as"""
         if add_as is None:
             add_as = filename
-        try:
-            with open(filename, "r") as fio:
-                basename = os.path.basename(add_as)
-                self.data["files"][basename] = fio.read()
-        except UnicodeDecodeError:
-            # file is binary
-            with open(filename, "rb") as fio:
-                basename = os.path.basename(add_as)
-                self.data["files"][basename] = (
-                    "data:application/octet-stream;base64,"
-                    + b64encode(fio.read()).decode()
-                )
+        self.data["files"][os.path.basename(add_as)] = _read_file(filename)
 
     def add_files(self, filenames, add_as=None):
         """Adds files to runner data
@@ -189,8 +195,16 @@ class RunnerData:
         else:
             add_as = filenames
 
-        for name_, filename in zip(add_as, filenames):
-            self.add_file(filename, name_)
+        # read all files before adding any of them, each file once even
+        # when it is added under several names
+        contents = {
+            filename: _read_file(filename) for filename in dict.fromkeys(filenames)
+        }
+        files = {
+            os.path.basename(name_): contents[filename]
+            for name_, filename in zip(add_as, filenames)
+        }
+        self.data["files"].update(files)
 
     @property
     def scheduler_options(self):
@@ -236,6 +250,23 @@ class RunnerData:
         _test_keep_run(keep_run)
         self.data["keep_run"] = keep_run
 
+    def clone(self):
+        """Independent copy of the RunnerData
+
+        The data is deep copied through a pickle round trip, so tasks,
+        files and options of the clone can be changed without affecting
+        the original.
+
+        Returns:
+            :class:`~runner.utils.runnerdata.RunnerData`: copy of the
+            runner data
+        """
+        runnerdata = self.__class__()
+        runnerdata.data = pickle.loads(
+            pickle.dumps(self.data, protocol=pickle.HIGHEST_PROTOCOL)
+        )
+        return runnerdata
+
     def get_runner_data(self, _skip_empty_task_test=False):
         """
         helper function to get complete runner data
@@ -248,12 +279,6 @@ class RunnerData:
             dict: dictionary of filenames as key and strings as value
         """
         data = self.data
-        scheduler_options = {}
-        name = ""
-        parents = []
-        tasks = []
-        files = {}
-
         if data is None:
             raise RuntimeError("No runner data")
 
@@ -282,21 +307,20 @@ class RunnerData:
             ids (int, or list): ids in the database"""
         if not isinstance(ids, (tuple, list)):
             ids = [ids]
-        # test if data is appropriate
+        # test if data is appropriate, before touching the database
         _ = self.get_runner_data()
         fdb = get_db_connect(database)
-        for id_ in ids:
-            data = fdb.get(id_).data
-            data["runner"] = self.data
-            fdb.update(id_, data=data)
+        with _single_connection(fdb):
+            for id_ in ids:
+                # update merges into the present row data
+                fdb.update(id_, data={"runner": self.data})
 
     def to_json(self, filename):
         """Saves RunnerData to json
 
         Args:
             filename (str): name of `json` file"""
-        with open(filename, "w") as fio:
-            json.dump(self.data, fio)
+        write_file(filename, json_dumps(self.data))
 
     @classmethod
     def from_db(cls, database, id_):
@@ -315,6 +339,27 @@ class RunnerData:
         data.pop("log", None)
         return cls.from_data_dict(data)
 
+    @classmethod
+    def from_db_many(cls, database, ids):
+        """get RunnerData of many ids from database, using a single
+        connection
+
+        Args:
+            databse (str): ase database
+            ids (list): ids in the database
+
+        Returns:
+            list: :class:`~runner.utils.runnerdata.RunnerData` of each id
+        """
+        fdb = get_db_connect(database)
+        runnerdatas = []
+        with _single_connection(fdb):
+            for id_ in ids:
+                data = fdb.get(id_).data["runner"]
+                data.pop("log", None)
+                runnerdatas.append(cls.from_data_dict(data))
+        return runnerdatas
+
     @classmethod
     def from_json(cls, filename):
         """get RunnerData from json
@@ -326,8 +371,8 @@ class RunnerData:
             :class:`~runner.utils.runnerdata.RunnerData`: class defining
             runner data
         """
-        with open(filename) as fio:
-            data = json.load(fio, object_hook=json_keys2int)
+        with open(filename, "rb") as fio:
+            data = json_loads(fio.read())
         return cls.from_data_dict(data)
 
     @classmethod
@@ -348,6 +393,21 @@ class RunnerData:
         return runnerdata
 
 
+def _read_file(filename):
+    """reads file with a single binary read, returns the text or, if the
+    file is binary, its base64 data url"""
+    with open(filename, "rb") as fio:
+        content = fio.read()
+    if os.path.splitext(filename)[1].lower() not in _binary_extensions:
+        try:
+            return content.decode()
+        except UnicodeDecodeError:
+            pass
+    # file is binary, free the raw bytes before building the string
+    content = b64encode(content)
+    return "data:application/octet-stream;base64," + content.decode("ascii")
+
+
 def _test_name(name, log_msg=""):
     if not isinstance(name, str):
         err = log_msg + "Runner: name should be str\n"
@@ -361,13 +421,12 @@ def _test_keep_run(keep_run, log_msg=""):
 
 
 def _test_parents(parents, log_msg=""):
-    if not isinstance(parents, (list, tuple)):
+    if not isinstance(parents, _sequence_types):
         err = log_msg + "Runner: Parents should be a list of int\n"
         raise RuntimeError(err)
-    for i in parents:
-        if not isinstance(i, int):
-            err = log_msg + "Runner: parents should be a list of" "int\n"
-            raise RuntimeError(err)
+    if not all(isinstance(i, int) for i in parents):
+        err = log_msg + "Runner: parents should be a list of" "int\n"
+        raise RuntimeError(err)
 
 
 def _test_files(files, log_msg=""):
@@ -376,11 +435,14 @@ def _test_files(files, log_msg=""):
         raise RuntimeError(err)
     for filename, content in files.items():
         if filename in default_files:
-            raise RuntimeError(log_msg + f"Runner: {filename=} in {default_files=}")
+            raise RuntimeError(
+                log_msg
+                + f"Runner: {filename=} in default_files={sorted(default_files)}"
+            )
         if not isinstance(filename, str):
             err = log_msg + "Runner: filenames should be str\n"
             raise RuntimeError(err)
-        if not isinstance(content, (str, bytes)):
+        if not isinstance(content, _content_types):
             err = log_msg + "Runner: file contents should be str" " or bytes\n"
             raise RuntimeError(err)
 
@@ -388,7 +450,7 @@ def _test_files(files, log_msg=""):
 def _test_tasks(tasks, files=None, log_msg="", _skip_empty_task_test=True):
     if files is None:
         files = {}
-    if not isinstance(tasks, (list, tuple)):
+    if not isinstance(tasks, _sequence_types):
         err = log_msg + "Runner: tasks should be a list\n"
         raise RuntimeError(err)
 
@@ -396,7 +458,7 @@ def _test_tasks(tasks, files=None, log_msg="", _skip_empty_task_test=True):
         err = log_msg + "Runner: tasks empty\n"
         raise RuntimeError(err)
     for task in tasks:
-        if not isinstance(task, (tuple, list)):
+        if not isinstance(task, _sequence_types):
             err = log_msg + "Runner: each task should be a list\n"
             raise RuntimeError(err)
         if len(task) < 2:
@@ -410,35 +472,41 @@ def _test_tasks(tasks, files=None, log_msg="", _skip_empty_task_test=True):
                 log_msg + "Runner: shell command or python filename" " should be str\n"
             )
             raise RuntimeError(err)
-        if task[0] == "python":
-            # testing filename in files
-            filename = copy(task[1])
-            if not filename.endswith(".py"):
-                filename += ".py"
-            if filename not in files:
-                err = (
-                    log_msg + "Runner: python filename {} should"
-                    " be in files\n".format(filename)
-                )
-                raise RuntimeError(err)
-            if len(task) > 2:
-                if not isinstance(task[2], dict):
-                    err = log_msg + "Runner: python parameters " "should be dict\n"
-                    raise RuntimeError(err)
-            if len(task) > 3:
-                if not isinstance(task[3], str):
-                    err = log_msg + "Runner: python command should" "be str\n"
-                    raise RuntimeError(err)
-        elif task[0] != "shell":
+        test = _task_tests.get(task[0]) if isinstance(task[0], str) else None
+        if test is None:
             raise RuntimeError("Runner: task should either be 'shell'" " or 'python'\n")
+        test(task, files, log_msg)
+
+
+def _test_shell_task(task, files, log_msg=""):
+    pass
+
+
+def _test_python_task(task, files, log_msg=""):
+    # testing filename in files
+    filename = task[1]
+    if not filename.endswith(".py"):
+        filename += ".py"
+    if filename not in files:
+        err = log_msg + "Runner: python filename {} should" " be in files\n".format(
+            filename
+        )
+        raise RuntimeError(err)
+    if len(task) > 2:
+        if not isinstance(task[2], dict):
+            err = log_msg + "Runner: python parameters " "should be dict\n"
+            raise RuntimeError(err)
+    if len(task) > 3:
+        if not isinstance(task[3], str):
+            err = log_msg + "Runner: python command should" "be str\n"
+            raise RuntimeError(err)
+
+
+# task type specific tests, after the common tests of _test_tasks
+_task_tests = {"shell": _test_shell_task, "python": _test_python_task}
 
 
 def _test_scheduler_options(scheduler_options, log_msg=""):
     if not isinstance(scheduler_options, dict):
         err = log_msg + "Runner: scheduler_options should be a dict\n"
         raise RuntimeError(err)
-
-
-def _tasks2file(tasks):
-    """converts tasks to run_scripts and files"""
-    pass
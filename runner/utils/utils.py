@@ -2,7 +2,18 @@
 Utility tools for runners
 """
 import os
+import re
+import json
+import math
+from contextlib import nullcontext
 import ase.db as db
+from ase.db.core import Database
+
+try:
+    # faster json, used when available
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
 
 
 class Cd:
@@ -14,15 +25,60 @@ class Cd:
         self.new_path = os.path.expanduser(new_path)
         self.saved_path = None
 
-        if not os.path.exists(new_path) and mkdir:
-            os.mkdir(new_path)
+        if mkdir:
+            try:
+                os.mkdir(self.new_path)
+            except FileExistsError:
+                pass
 
     def __enter__(self):
-        self.saved_path = os.getcwd()
-        os.chdir(self.new_path)
+        if os.chdir in os.supports_fd:
+            # directory fd, restored without resolving the path again
+            self.saved_path = os.open(".", os.O_RDONLY | os.O_DIRECTORY)
+        else:
+            self.saved_path = os.getcwd()
+        try:
+            os.chdir(self.new_path)
+        except OSError:
+            self._close_saved()
+            raise
 
     def __exit__(self, etype, value, traceback):
-        os.chdir(self.saved_path)
+        try:
+            os.chdir(self.saved_path)
+        finally:
+            self._close_saved()
+
+    def _close_saved(self):
+        if isinstance(self.saved_path, int):
+            os.close(self.saved_path)
+        self.saved_path = None
+
+
+def write_file(filename, string, mode=0o644):
+    """Writes string, or bytes, to filename with a single write call,
+    bypassing the buffered text io
+
+    :meta private:
+    """
+    if isinstance(string, str):
+        string = string.encode()
+    buf = memoryview(string)
+    fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    try:
+        while buf:
+            # write can be partial for large buffers
+            buf = buf[os.write(fd, buf) :]
+    finally:
+        os.close(fd)
+
+
+def _int_key(key):
+    """cheap check if int(key) can succeed, to skip most failing conversions"""
+    if isinstance(key, str):
+        first = key[:1]
+        return first.isdigit() or first in ("+", "-") or first.isspace()
+    return True
 
 
 def json_keys2int(dict_):
@@ -31,14 +87,87 @@ def json_keys2int(dict_):
 
     :meta private:
     """
-    if isinstance(dict_, dict):
+    if isinstance(dict_, dict) and all(map(_int_key, dict_)):
         try:
-            return {{int(k): v for k, v in dict_.items()}}
+            return {int(k): v for k, v in dict_.items()}
         except ValueError:
             pass
     return dict_
 
 
+def _pairs2dict(pairs):
+    """dict from key value pairs, with keys converted to int as in
+    :func:`json_keys2int`, without building an intermediate dict"""
+    if all(_int_key(k) for k, _ in pairs):
+        try:
+            return {int(k): v for k, v in pairs}
+        except ValueError:
+            pass
+    return dict(pairs)
+
+
+def _keys2int(obj):
+    """applies :func:`json_keys2int` to all the dicts in obj, inner first,
+    as the object_hook of :func:`json.loads` would"""
+    if isinstance(obj, dict):
+        return _pairs2dict([(k, _keys2int(v)) for k, v in obj.items()])
+    if isinstance(obj, list):
+        return [_keys2int(v) for v in obj]
+    return obj
+
+
+def _finite(obj):
+    """whether all the floats in obj are finite, orjson writes inf and nan
+    as null"""
+    if isinstance(obj, float):
+        return math.isfinite(obj)
+    if isinstance(obj, dict):
+        return all(_finite(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return all(_finite(v) for v in obj)
+    return True
+
+
+# integers orjson might read as floats, longer than 18 digits
+_long_int = re.compile(r"\d{19}")
+_long_int_bytes = re.compile(rb"\d{19}")
+
+
+def json_dumps(obj):
+    """Serializes obj to json bytes, using orjson if available
+
+    Falls back to :func:`json.dumps` for data orjson can not write exactly,
+    inf, nan and integers beyond 64 bits.
+
+    :meta private:
+    """
+    if orjson is not None and _finite(obj):
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            pass
+    return json.dumps(obj).encode()
+
+
+def json_loads(string):
+    """Deserializes json string or bytes, converting int keys back with
+    :func:`json_keys2int`. Uses orjson if available
+
+    Falls back to :func:`json.loads` for Infinity and NaN, and for long
+    integers that orjson would read as floats.
+
+    :meta private:
+    """
+    if orjson is not None:
+        long_int = _long_int_bytes if isinstance(string, bytes) else _long_int
+        if long_int.search(string) is None:
+            try:
+                return _keys2int(orjson.loads(string))
+            except orjson.JSONDecodeError:
+                pass
+    return json.loads(string, object_pairs_hook=_pairs2dict)
+
+
 def get_db_connect(database):
     """Returns :class:`~ase.db` from database string
 
@@ -49,6 +178,17 @@ def get_db_connect(database):
     return database
 
 
+def _single_connection(fdb):
+    """context using a single connection, and commit, for all operations on
+    fdb, unless the caller already holds a connection
+
+    :meta private:
+    """
+    if getattr(fdb, "connection", None) is None:
+        return fdb
+    return nullcontext()
+
+
 def get_status(input_id, database):
     """Gets status of input_id in the database
 
@@ -109,6 +249,17 @@ def _get_info(input_id, database):
     return formula, name, parents, status, tasks
 
 
+# fill colors of the runner data nodes in get_graphical_status, by status
+_status_colors = {
+    "running": "yellow",
+    "failed": "red",
+    "submit": "grey",
+    "cancel": "grey",
+    "done": "green",
+    "No status": "white",
+}
+
+
 def get_graphical_status(
     filename, input_ids, database, add_tasks=False, _get_info=_get_info
 ):
@@ -158,55 +309,68 @@ def get_graphical_status(
         # add to the runnerdata
         dot.edge(f"{name}-tasks", name)
 
-    def spider(id_, seen_ids, dot):
-        if id_ in seen_ids:
-            return
-        seen_ids.append(id_)
-
-        formula, name, parents, status, tasks = _get_info(id_, database)
-        dot.node(
-            str(id_), label=f"{id_}: {formula}", style="filled", fillcolor="lightblue"
-        )
-
-        if name:
-            # add runner data graph
-            # get unique node name
-            node_name = f"{id_}-runnerdata"
-            color = status_colors[status]
+    def spider(root_id, seen_ids, dot):
+        """adds root_id and all its parents to dot, depth first, without
+        recursion"""
+        # stack of ids to visit, and of edges to add once the parent of
+        # the edge is visited
+        stack = [(root_id, None)]
+        while stack:
+            id_, edge = stack.pop()
+            if edge is not None:
+                dot.edge(*edge)
+                continue
+            # node names identify the rows in the graph
+            if str(id_) in seen_ids:
+                continue
+            seen_ids.add(str(id_))
+
+            formula, name, parents, status, tasks = _get_info(id_, database)
             dot.node(
-                node_name,
-                label=f"{name}\nStatus: {status}",
-                shape="box",
+                str(id_),
+                label=f"{id_}: {formula}",
                 style="filled",
-                fillcolor=color,
+                fillcolor="lightblue",
             )
 
-            if add_tasks:
-                add_task_graph(node_name, tasks, dot)
-
-            # now connect it to the formula node
-            dot.edge(node_name, str(id_))
-
-            # add parents
-            for parent in parents:
-                spider(parent, seen_ids, dot)
-                # connect the parent
-                dot.edge(str(parent), node_name)
+            if name:
+                # add runner data graph
+                # get unique node name
+                node_name = f"{id_}-runnerdata"
+                color = _status_colors.get(status, "white")
+                dot.node(
+                    node_name,
+                    label=f"{name}\nStatus: {status}",
+                    shape="box",
+                    style="filled",
+                    fillcolor=color,
+                )
+
+                if add_tasks:
+                    add_task_graph(node_name, tasks, dot)
+
+                # now connect it to the formula node
+                dot.edge(node_name, str(id_))
+
+                # add parents, in order, each followed by its connection
+                for parent in reversed(parents):
+                    stack.append((None, (str(parent), node_name)))
+                    stack.append((parent, None))
 
     if isinstance(input_ids, int):
         input_ids = [input_ids]
-    status_colors = {
-        "running": "yellow",
-        "failed": "red",
-        "submit": "grey",
-        "cancel": "grey",
-        "done": "green",
-        "No status": "white",
-    }
+    # connect once for all the rows of the graph
+    database = get_db_connect(database)
     dot = Digraph(comment="The Runner workflow", strict=True)
-    seen_ids = []
-    for input_id in input_ids:
-        spider(input_id, seen_ids, dot)
+    seen_ids = set()
+    if isinstance(database, Database):
+        # read all the rows of the graph over a single connection
+        connection = _single_connection(database)
+    else:
+        connection = nullcontext()
+    with connection:
+        for input_id in input_ids:
+            spider(input_id, seen_ids, dot)
     fileformat = filename.split(".")[-1]
     filename = ".".join(filename.split(".")[:-1])
     dot.render(filename, format=fileformat)
@@ -230,6 +394,26 @@ def get_runner_list(database):
     return runner_dict
 
 
+def _change_runner_meta(runner_name, database, change):
+    """reads the database metadata, applies change to the runners metadata
+    and writes the metadata back once
+
+    Args:
+        runner_name (str): name of the runner, has to exist
+        database (str): ASE database
+        change (callable): called with the runners metadata, raises
+            RuntimeError if the change is not allowed
+    """
+    fdb = get_db_connect(database)
+    meta = fdb.metadata
+    if "runners" not in meta:
+        raise RuntimeError(f"no runners in {database}")
+    if runner_name not in meta["runners"]:
+        raise RuntimeError(f"{runner_name} does not exist")
+    change(meta["runners"])
+    fdb.metadata = meta
+
+
 def remove_runner(runner_name, database, force=False):
     """Removes runner from database, if not running
 
@@ -238,19 +422,13 @@ def remove_runner(runner_name, database, force=False):
         database (str): ASE database
         force (bool): forcefully remove runner, if running
     """
-    fdb = get_db_connect(database)
-    meta = fdb.metadata
-    if "runners" in meta:
-        if runner_name in meta["runners"]:
-            if not meta["runners"][runner_name].get("running", False) or force:
-                meta["runners"].pop(runner_name)
-                fdb.metadata = meta
-            else:
-                raise RuntimeError(f"{runner_name} is running")
-        else:
-            raise RuntimeError(f"{runner_name} does not exist")
-    else:
-        raise RuntimeError(f"no runners in {database}")
+
+    def remove(runners):
+        if runners[runner_name].get("running", False) and not force:
+            raise RuntimeError(f"{runner_name} is running")
+        runners.pop(runner_name)
+
+    _change_runner_meta(runner_name, database, remove)
 
 
 def stop_runner(runner_name, database):
@@ -261,16 +439,10 @@ def stop_runner(runner_name, database):
         runner_name (str): name of the runner
         database (str): ASE database
     """
-    fdb = get_db_connect(database)
-    meta = fdb.metadata
-    if "runners" in meta:
-        if runner_name in meta["runners"]:
-            if meta["runners"][runner_name].get("running", False):
-                meta["runners"][runner_name]["_explicit_stop"] = True
-                fdb.metadata = meta
-            else:
-                raise RuntimeError(f"{runner_name} is not running")
-        else:
-            raise RuntimeError(f"{runner_name} does not exist")
-    else:
-        raise RuntimeError(f"no runners in {database}")
+
+    def stop(runners):
+        if not runners[runner_name].get("running", False):
+            raise RuntimeError(f"{runner_name} is not running")
+        runners[runner_name]["_explicit_stop"] = True
+
+    _change_runner_meta(runner_name, database, stop)
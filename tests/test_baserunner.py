@@ -1,11 +1,10 @@
 import time
-from copy import copy
 import os
 
 import ase.db as db
 from ase.atoms import Atoms
 
-from runner import TerminalRunner
+from runner import TerminalRunner, RunnerData
 
 
 energy = """\
@@ -31,17 +30,18 @@ runner = {
         "test.bin": "data:application/octet-stream;base64,/zs6",
     },
 }
+template = RunnerData.from_data_dict(runner)
 
 
 def test_successful_run():
     """test run and parent run"""
     with db.connect("database.db") as fdb:
-        data = {"runner": copy(runner)}
+        data = {"runner": template.clone().data}
         id_ = fdb.write(Atoms(), data=data, status="submit", runner="terminal:test")
         data["runner"]["parents"] = [id_]
         id_1 = fdb.write(Atoms(), data=data, status="submit", runner="terminal:test")
         # waiting on next pass
-        data = {"runner": copy(runner)}
+        data = {"runner": template.clone().data}
         data["runner"]["tasks"][0][1] = "sleep 7"
         id_2 = fdb.write(Atoms(), data=data, status="submit", runner="terminal:test")
         # test max jobs and keep run
@@ -83,14 +83,14 @@ def test_failed_run():
     id_ = [None for _ in range(4)]
     with db.connect("database.db") as fdb:
         # job id lost
-        data = {"runner": copy(runner)}
+        data = {"runner": template.clone().data}
         data["runner"]["tasks"].append(["shell", "rm job.id"])
         id_[0] = fdb.write(Atoms(), data=data, status="submit", runner="terminal:test")
         # unpickling fail
         data["runner"]["tasks"][4][1] = "cp run.sh atoms.pkl"
         id_[1] = fdb.write(Atoms(), data=data, status="submit", runner="terminal:test")
         # bad runner data
-        data = {"runner": copy(runner)}
+        data = {"runner": template.clone().data}
         data["runner"]["tasks"][1][1] = "energy1.py"
         id_[2] = fdb.write(Atoms(), data=data, status="submit", runner="terminal:test")
         data["runner"]["tasks"] = []
@@ -1,7 +1,9 @@
 import pytest
 import os
+import math
 import ase.db as db
 from ase.atoms import Atoms
+from runner.utils import utils, json_keys2int
 from runner.utils.runnerdata import RunnerData
 
 
@@ -50,7 +52,7 @@ def test_runnerdata():
     assert "energy.py" in files
     assert len(tasks) == 0
 
-    fail = [None for _ in range(16)]
+    fail = [None] * 16
     # empty tasks
     fail[1] = {
         "name": "energy calculation",
@@ -287,3 +289,70 @@ def test_to_from_data():
     assert files["test.bin"] == "data:application/octet-stream;base64,/zs6"
     assert "energy.py" in files
     assert len(tasks) == 4
+    # clones do not share nested data
+    clone = runner.clone()
+    clone.tasks[1][1] = "energy1.py"
+    clone.parents.append(3)
+    assert runner.tasks[1][1] == "energy.py"
+    assert len(runner.parents) == 2
+    assert clone.data == {**runner.data, "tasks": clone.tasks, "parents": [1, 2, 3]}
+    runners = RunnerData.from_db_many("database.db", [1])
+    assert len(runners) == 1 and runners[0].name == "energy calculation"
+
+
+def test_inplace_changes_checked():
+    with db.connect("database.db") as fdb:
+        id_ = fdb.write(Atoms())
+    run = RunnerData()
+    run.files = {"energy.py": "import numpy as np"}
+    run.append_tasks("python", "energy.py")
+    run.to_db("database.db", id_)
+    # changes to the returned objects are checked as well
+    run.tasks.append(["python", "missing.py"])
+    with pytest.raises(RuntimeError):
+        run.to_db("database.db", id_)
+    run.tasks.pop()
+    run.parents.append("1")
+    with pytest.raises(RuntimeError):
+        run.to_db("database.db", id_)
+    assert RunnerData.from_db("database.db", id_).parents == []
+
+
+@pytest.mark.parametrize("json_lib", ["orjson", "json"])
+def test_json_int_keys(json_lib, monkeypatch):
+    if json_lib == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        # stdlib fallback
+        monkeypatch.setattr(utils, "orjson", None)
+    assert json_keys2int({}) == {}
+    assert json_keys2int({"1": "a", "2": "b"}) == {1: "a", 2: "b"}
+    assert json_keys2int({"1": "a", "b": "b"}) == {"1": "a", "b": "b"}
+
+    params = {
+        "kpts": {0: [1, 1, 1], 1: [2, 2, 2]},
+        "mixed": {"1": 1, "a": 2},
+        "big": 2**70,
+    }
+    run = RunnerData.from_data_dict(
+        {
+            "name": "int keys",
+            "tasks": [["python", "energy.py", params]],
+            "files": {"energy.py": "import numpy as np"},
+            "scheduler_options": {},
+        }
+    )
+    run.to_json("runner.json")
+    run = RunnerData.from_json("runner.json")
+    assert run.scheduler_options == {}
+    assert run.tasks[0][2] == params
+
+    # non-finite floats are kept
+    params = {"tol": math.inf, "mixing": [math.nan, -math.inf]}
+    run.tasks = [["python", "energy.py", params]]
+    run.to_json("runner.json")
+    run = RunnerData.from_json("runner.json")
+    task_params = run.tasks[0][2]
+    assert task_params["tol"] == math.inf
+    assert math.isnan(task_params["mixing"][0])
+    assert task_params["mixing"][1] == -math.inf
@@ -0,0 +1,206 @@
+import os
+import subprocess
+
+import pytest
+
+from runner import SlurmRunner
+from runner.runners import slurm
+
+
+class FakeSlurm:
+    """replaces subprocess.run in the slurm runner, answering slurm commands
+    with the handler of the command, and recording the calls"""
+
+    def __init__(self, **handlers):
+        self.handlers = handlers
+        self.calls = []
+
+    def __call__(self, args, **kwargs):
+        self.calls.append(list(args))
+        returncode, stdout, stderr = self.handlers[args[0]](args)
+        return subprocess.CompletedProcess(args, returncode, stdout, stderr)
+
+
+def squeue(states):
+    """squeue handler for jobs in the queue with the given states"""
+
+    def handler(args):
+        if "--help" in args:
+            return 0, b"", b""
+        job_ids = args[args.index("--jobs") + 1].split(",")
+        if any(job_id not in states for job_id in job_ids):
+            return 1, b"", b"slurm_load_jobs error: Invalid job id specified\n"
+        lines = [f"{job_id} {states[job_id]}\n" for job_id in job_ids]
+        return 0, "".join(lines).encode(), b""
+
+    return handler
+
+
+@pytest.fixture
+def runner():
+    return SlurmRunner("test")
+
+
+def test_squeue_unknown_ids(runner, monkeypatch):
+    fake = FakeSlurm(squeue=squeue({"1": "RUNNING", "3": "PENDING", "4": "RUNNING"}))
+    monkeypatch.setattr(slurm.sb, "run", fake)
+    states = runner._squeue_states(["1", "2", "3", "4"])
+    # the unknown job id does not hide the jobs in the queue
+    assert states == {"1": "RUNNING", "3": "PENDING", "4": "RUNNING"}
+
+    # other squeue errors give no queue information
+    fake.handlers["squeue"] = lambda args: (1, b"", b"Unable to contact controller")
+    assert runner._squeue_states(["1", "3"]) is None
+
+
+sacct_out = b"""\
+101|batch.slrm|COMPLETED|2024-01-01T10:00:00|00:01:00|00:16:00|
+101.batch|batch|COMPLETED|2024-01-01T10:00:00|00:01:00|00:16:00|
+101.extern|extern|COMPLETED|2024-01-01T10:00:00|00:01:00|00:16:00|
+102|batch.slrm|CANCELLED by 1000|2024-01-01T10:00:00|00:01:00|00:16:00|
+102.batch|batch|CANCELLED|2024-01-01T10:00:00|00:01:00|00:16:00|
+103|batch.slrm|COMPLETED|2024-01-01T10:00:00|00:01:00|00:16:00|
+103.batch|batch|OUT_OF_MEMORY|2024-01-01T10:00:00|00:01:00|00:16:00|
+104|batch.slrm|RUNNING|Unknown|00:01:00|00:16:00|
+104.batch|batch|RUNNING|Unknown|00:01:00|00:16:00|
+105_2|array.slrm|COMPLETED|2024-01-01T10:00:00|00:01:00|00:16:00|
+105_2.batch|batch|FAILED|2024-01-01T10:00:00|00:01:00|00:16:00|
+gibberish
+"""
+
+
+def test_sacct_status(runner, monkeypatch):
+    fake = FakeSlurm(sacct=lambda args: (0, sacct_out, b""))
+    monkeypatch.setattr(slurm.sb, "run", fake)
+    status = runner._sacct_status(["101", "102", "103", "104", "105_2", "106"])
+    # job steps are grouped with their job
+    assert tuple(status["101"]) == (
+        "done",
+        "2024-01-01 10:00:00\n Job finished.\nWall time=00:16:00",
+    )
+    assert status["102"][0] == "failed" and "CANCELLED" in status["102"][1]
+    assert status["103"][0] == "failed"
+    assert "Undefined slurm state:OUT_OF_MEMORY" in status["103"][1]
+    assert tuple(status["104"]) == ("running", "")
+    # a failed step fails the job
+    assert status["105_2"][0] == "failed" and "FAILED" in status["105_2"][1]
+    # jobs missing in sacct are left out
+    assert "106" not in status
+    # no status if sacct failed
+    fake.handlers["sacct"] = lambda args: (1, b"", b"slurmdbd not reachable")
+    assert runner._sacct_status(["101"]) is None
+
+
+def test_query_status(runner, monkeypatch):
+    fake = FakeSlurm(
+        squeue=squeue({"104": "RUNNING", "107": "PENDING", "108": "COMPLETING"}),
+        sacct=lambda args: (0, sacct_out, b""),
+    )
+    monkeypatch.setattr(slurm.sb, "run", fake)
+    status = runner._query_status(["101", "104", "106", "107", "108"])
+    assert status["101"][0] == "done"
+    assert status["104"] == ["running", ""]
+    assert status["107"] == ["running", ""]
+    assert status["108"] == ["running", ""]
+    # neither in the queue nor in sacct
+    assert status["106"][0] == "failed"
+    assert "Job not found in squeue or sacct" in status["106"][1]
+    # only the jobs that left the queue are checked with sacct
+    sacct_call = [call for call in fake.calls if call[0] == "sacct"][-1]
+    assert sacct_call[2] == "101,106"
+
+    # missing jobs are kept running if squeue or sacct failed
+    fake.handlers["sacct"] = lambda args: (1, b"", b"slurmdbd not reachable")
+    assert runner._query_status(["106"])["106"] == ["running", ""]
+    fake.handlers["sacct"] = lambda args: (0, sacct_out, b"")
+    fake.handlers["squeue"] = lambda args: (1, b"", b"Unable to contact controller")
+    assert runner._query_status(["106"])["106"] == ["running", ""]
+
+
+def sbatch(returncode=0):
+    """sbatch handler numbering the jobs from 500, records the submission
+    folder and the submitted script"""
+    submitted = []
+
+    def handler(args):
+        with open(args[-1]) as fio:
+            submitted.append((os.getcwd(), args, fio.read()))
+        if returncode != 0:
+            return returncode, b"", b"sbatch: error: Batch job submission failed"
+        return 0, f"Submitted batch job {499 + len(submitted)}\n".encode(), b""
+
+    handler.submitted = submitted
+    return handler
+
+
+def make_submissions(options):
+    """submissions of rows 1, 2, ... with the given scheduler_options"""
+    submissions = []
+    for id_, scheduler_options in enumerate(options, 1):
+        os.mkdir(str(id_))
+        submissions.append((id_, [f"echo {id_}"], scheduler_options))
+    return submissions
+
+
+def test_submit_many(runner, monkeypatch):
+    fake = FakeSlurm(sbatch=sbatch())
+    monkeypatch.setattr(slurm.sb, "run", fake)
+    submissions = make_submissions(
+        [
+            {"-N": 1},
+            {"-N": 1},
+            {"-N": 2},
+            {"-N": 1, "--output": "run.out"},
+            {"-N": 1},
+        ]
+    )
+    results = runner._submit_many(submissions)
+    job_ids = [job_id for job_id, _ in results]
+    # rows with the same options are one array, custom outputs are not
+    assert job_ids == ["500_0", "500_1", "501", "502", "500_2"]
+    assert "Submitted batch job 500_2" in results[4][1]
+
+    submitted = fake.handlers["sbatch"].submitted
+    folder, args, script = submitted[0]
+    assert folder == os.path.abspath("1")
+    assert args == ["sbatch", "--array=0-2", "array.slrm"]
+    assert "#SBATCH -N 1\n" in script
+    assert "#SBATCH --output=/dev/null\n" in script
+    assert "set -- 1 2 5\nshift \"$SLURM_ARRAY_TASK_ID\"\n" in script
+    # each array task runs the batch script of its row
+    for id_ in (1, 2, 5):
+        with open(os.path.join(str(id_), "batch.slrm")) as fio:
+            assert fio.read().endswith(f"echo {id_}")
+    folder, args, script = submitted[2]
+    assert folder == os.path.abspath("4")
+    assert args == ["sbatch", "batch.slrm"]
+    assert "#SBATCH --output=run.out\n" in script
+
+
+def test_submit_array_size(runner, monkeypatch):
+    fake = FakeSlurm(sbatch=sbatch())
+    monkeypatch.setattr(slurm.sb, "run", fake)
+    monkeypatch.setattr(slurm, "max_array_size", 2)
+    results = runner._submit_many(make_submissions([{"-N": 1}] * 5))
+    # large groups are split in arrays of max_array_size
+    assert [job_id for job_id, _ in results] == [
+        "500_0",
+        "500_1",
+        "501_0",
+        "501_1",
+        "502",
+    ]
+    args = [args for _, args, _ in fake.handlers["sbatch"].submitted]
+    assert args[0] == args[1] == ["sbatch", "--array=0-1", "array.slrm"]
+    assert args[2] == ["sbatch", "batch.slrm"]
+
+
+def test_submit_array_failed(runner, monkeypatch):
+    fake = FakeSlurm(sbatch=sbatch(returncode=1))
+    monkeypatch.setattr(slurm.sb, "run", fake)
+    results = runner._submit_many(make_submissions([{"-N": 1}] * 3))
+    # every row of a failed array fails
+    assert len(results) == 3
+    for job_id, log_msg in results:
+        assert job_id is None
+        assert "Submission failed: sbatch: error" in log_msg